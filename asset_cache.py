@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import shutil
+import tempfile
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- Worker-local, disk-backed asset cache ---
+# Layout under ASSET_CACHE_DIR:
+#   blobs/<sha256 of content>   the cached bytes (content-addressed, shared by every URL/key that maps to them)
+#   index/<sha256 of key>.json  {"key", "blob", "etag", "size", "fetched_at"}
+#   locks/<sha256 of key>.lock  per-key flock so only one process downloads a given asset at a time
+#   .lock                       global flock held while evicting
+# Blob mtimes are bumped on every hit and eviction removes the least recently used blobs first,
+# so the cache is safe to share between several worker processes on one disk.
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join(tempfile.gettempdir(), "makeaclip-asset-cache"))
+ASSET_CACHE_MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+ASSET_CACHE_REVALIDATE_SECONDS = int(os.getenv("ASSET_CACHE_REVALIDATE_SECONDS", str(24 * 3600)))
+ASSET_DOWNLOAD_TIMEOUT = (int(os.getenv("ASSET_CONNECT_TIMEOUT", "10")), int(os.getenv("ASSET_READ_TIMEOUT", "60")))  # (connect, per-read) seconds
+CHUNK_SIZE = 1024 * 1024
+
+_sessions = {}
+def pooled_session(name, retry, pool_maxsize=10, headers=None):
+    # One keep-alive pool per process and name, rebuilt after fork so work horses never share the parent's sockets.
+    session, pid = _sessions.get(name, (None, None))
+    if session is None or pid != os.getpid():
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        session = requests.Session(); session.mount("https://", adapter); session.mount("http://", adapter); session.headers.update(headers or {}); _sessions[name] = (session, os.getpid())
+    return session
+
+def get_download_session(): return pooled_session("assets", Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)))
+
+def _key_hash(key): return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+class AssetCache:
+    def __init__(self, root=ASSET_CACHE_DIR, max_bytes=ASSET_CACHE_MAX_BYTES, revalidate_seconds=ASSET_CACHE_REVALIDATE_SECONDS):
+        self.root = root; self.max_bytes = max_bytes; self.revalidate_seconds = revalidate_seconds
+        self.blob_dir = os.path.join(root, "blobs"); self.index_dir = os.path.join(root, "index"); self.lock_dir = os.path.join(root, "locks")
+        for d in (self.blob_dir, self.index_dir, self.lock_dir): os.makedirs(d, exist_ok=True)
+
+    @contextmanager
+    def _lock(self, path):
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try: yield
+            finally: fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_entry(self, key):
+        try:
+            with open(os.path.join(self.index_dir, _key_hash(key) + ".json")) as f: entry = json.load(f)
+        except (OSError, ValueError): return None
+        return entry if os.path.exists(os.path.join(self.blob_dir, entry["blob"])) else None
+
+    def _write_entry(self, key, entry):
+        index_path = os.path.join(self.index_dir, _key_hash(key) + ".json"); tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f: json.dump(entry, f)
+        os.replace(tmp_path, index_path)
+
+    def _touch(self, entry):
+        try: os.utime(os.path.join(self.blob_dir, entry["blob"]))
+        except OSError: pass
+
+    def _store_stream(self, chunks):
+        # Hash while writing so the final blob name is the content hash; the rename is atomic.
+        digest = hashlib.sha256(); size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    if chunk: f.write(chunk); digest.update(chunk); size += len(chunk)
+            blob = digest.hexdigest(); os.replace(tmp_path, os.path.join(self.blob_dir, blob))
+            return blob, size
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+
+    def blob_path(self, entry): return os.path.join(self.blob_dir, entry["blob"])
+
+    def get_entry(self, key):
+        entry = self._read_entry(key)
+        if entry: self._touch(entry)
+        return entry
+
+    def get(self, key):
+        entry = self._read_entry(key)
+        if entry: self._touch(entry); return self.blob_path(entry)
+        return None
+
+    def put_file(self, key, src_path, **extra):
+        def chunks():
+            with open(src_path, "rb") as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk: return
+                    yield chunk
+        blob, size = self._store_stream(chunks())
+        self._write_entry(key, {"key": key, "blob": blob, "size": size, "fetched_at": time.time(), **extra}); self.evict()
+        return os.path.join(self.blob_dir, blob)
+
+    def fetch_url(self, url, session=None, timeout=ASSET_DOWNLOAD_TIMEOUT):
+        entry = self._read_entry(url)
+        if entry and time.time() - entry.get("fetched_at", 0) < self.revalidate_seconds: self._touch(entry); return self.blob_path(entry)
+        with self._lock(os.path.join(self.lock_dir, _key_hash(url) + ".lock")):
+            # Another process may have filled the entry while we were waiting on the lock.
+            entry = self._read_entry(url)
+            if entry and time.time() - entry.get("fetched_at", 0) < self.revalidate_seconds: self._touch(entry); return self.blob_path(entry)
+            headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else {}
+            # Streamed in CHUNK_SIZE pieces straight to disk, so memory stays flat however large the asset is.
+            with (session or get_download_session()).get(url, stream=True, headers=headers, timeout=timeout) as r:
+                if r.status_code == 304 and entry:
+                    entry["fetched_at"] = time.time(); self._write_entry(url, entry); self._touch(entry); return self.blob_path(entry)
+                r.raise_for_status()
+                blob, size = self._store_stream(r.iter_content(chunk_size=CHUNK_SIZE))
+                entry = {"key": url, "blob": blob, "etag": r.headers.get("ETag"), "size": size, "fetched_at": time.time()}
+            self._write_entry(url, entry)
+        self.evict()
+        return self.blob_path(entry)
+
+    def evict(self):
+        with self._lock(os.path.join(self.root, ".lock")):
+            blobs = []
+            for name in os.listdir(self.blob_dir):
+                if name.endswith(".part"): continue
+                try: st = os.stat(os.path.join(self.blob_dir, name))
+                except OSError: continue
+                blobs.append((st.st_mtime, st.st_size, name))
+            total = sum(size for _, size, _ in blobs)
+            for _, size, name in sorted(blobs):
+                if total <= self.max_bytes: break
+                # Index entries pointing at a removed blob are treated as misses by _read_entry.
+                try: os.remove(os.path.join(self.blob_dir, name)); total -= size
+                except OSError: pass
+
+    def clear(self):
+        with self._lock(os.path.join(self.root, ".lock")):
+            for d in (self.blob_dir, self.index_dir): shutil.rmtree(d, ignore_errors=True); os.makedirs(d, exist_ok=True)
+
+def link_into(src_path, dest_path):
+    # Hard links keep the job's copy alive even if the cache evicts the blob mid-render,
+    # and cost nothing to remove with the job's temp dir. Fall back to a copy across devices.
+    if os.path.exists(dest_path): return dest_path
+    try: os.link(src_path, dest_path)
+    except OSError: shutil.copyfile(src_path, dest_path)
+    return dest_path
+
+_cache = None
+def get_asset_cache():
+    global _cache
+    if _cache is None: _cache = AssetCache()
+    return _cache
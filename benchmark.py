@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import random
+import shutil
+import base64
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- Offline benchmarks ---
+# Usage: python benchmark.py subtitles --chunks 300 --width 918
+#        python benchmark.py pipeline --runs 3 --words 250 --lines 10
+# Modules that read configuration at import time (tasks, tts, asset_cache) are imported inside the
+# commands, after the pipeline command has pointed the environment at its stub servers.
+WORDS = "the quick brown fox jumps over a lazy dog while my roommate keeps eating my leftovers again".split()
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+def synthetic_chunks(count, group_size, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(group_size)) for _ in range(count)]
+
+def bench_subtitles(args):
+    from moviepy.editor import TextClip
+    import subtitles
+    from tasks import SUBTITLE_STYLES
+    style = SUBTITLE_STYLES["standard"].copy(); style['fontsize'] = int(style['fontsize'] * args.size_multiplier)
+    chunks = synthetic_chunks(args.chunks, args.word_group_size)
+    started = time.perf_counter()
+    for text in chunks: subtitles.caption_clip(text, style, args.width)
+    pillow_seconds = time.perf_counter() - started; info = subtitles._render_caption.cache_info()
+    print(f"pillow:   {pillow_seconds:.3f}s for {len(chunks)} captions ({info.hits} cache hits, {info.misses} misses)")
+    if args.skip_textclip: return
+    started = time.perf_counter()
+    for text in chunks: TextClip(text, **style, size=(args.width, None), method='caption')
+    textclip_seconds = time.perf_counter() - started
+    print(f"textclip: {textclip_seconds:.3f}s for {len(chunks)} captions ({textclip_seconds / max(pillow_seconds, 1e-9):.1f}x slower)")
+
+# --- Stub servers for the end-to-end pipeline ---
+# One local HTTP server stands in for both ElevenLabs and the Cloudinary-hosted assets. TTS returns
+# quiet-tone MP3s whose length follows the text (~15 chars/sec) and evenly spread character alignment.
+# Pure silence would make the character task's audio_normalize divide by zero.
+class StubHandler(BaseHTTPRequestHandler):
+    assets_dir, ffmpeg, audio_cache, lock = None, None, {}, threading.Lock()
+    def log_message(self, *args): pass
+
+    def _send(self, body, content_type, status=200, headers=()):
+        self.send_response(status); self.send_header("Content-Type", content_type); self.send_header("Content-Length", str(len(body)))
+        for name, value in headers: self.send_header(name, value)
+        self.end_headers()
+        try: self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError): pass  # ffmpeg drops the connection once it has read what it needs before seeking
+
+    def _tone_mp3(self, seconds):
+        with self.lock:
+            if seconds not in self.audio_cache:
+                self.audio_cache[seconds] = subprocess.run([self.ffmpeg, "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=220:sample_rate=44100", "-t", f"{seconds:.1f}", "-af", "volume=0.05", "-c:a", "libmp3lame", "-f", "mp3", "pipe:1"], check=True, capture_output=True).stdout
+            return self.audio_cache[seconds]
+
+    def do_POST(self):
+        text = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["text"]; seconds = round(max(1.0, len(text) / 15), 1); audio = self._tone_mp3(seconds)
+        if not self.path.endswith("/with-timestamps"): return self._send(audio, "audio/mpeg")
+        step = seconds / max(len(text), 1)
+        alignment = {"characters": list(text), "character_start_times_seconds": [i * step for i in range(len(text))], "character_end_times_seconds": [(i + 1) * step for i in range(len(text))]}
+        self._send(json.dumps({"audio_base64": base64.b64encode(audio).decode(), "alignment": alignment}).encode(), "application/json")
+
+    def do_GET(self):
+        # Honours single "bytes=a-b" ranges like Cloudinary does, so BACKGROUND_FETCH_MODE=range can be benchmarked.
+        path = os.path.join(self.assets_dir, os.path.basename(self.path))
+        if not os.path.exists(path): self.send_response(404); self.send_header("Content-Length", "0"); self.end_headers(); return
+        with open(path, "rb") as f: body = f.read()
+        size, byte_range = len(body), self.headers.get("Range", "")
+        if not byte_range.startswith("bytes=") or "," in byte_range: return self._send(body, "application/octet-stream", headers=[("Accept-Ranges", "bytes")])
+        first, _, last = byte_range[6:].partition("-")
+        start, end = (size - int(last), size - 1) if not first else (int(first), min(int(last), size - 1) if last else size - 1)
+        if start >= size or start > end: self.send_response(416); self.send_header("Content-Range", f"bytes */{size}"); self.send_header("Content-Length", "0"); self.end_headers(); return
+        self._send(body[max(start, 0):end + 1], "application/octet-stream", status=206, headers=[("Accept-Ranges", "bytes"), ("Content-Range", f"bytes {max(start, 0)}-{end}/{size}")])
+
+def build_stub_assets(assets_dir, ffmpeg, size, bg_seconds):
+    from PIL import Image as PILImage
+    shutil.copy(os.path.join(STATIC_DIR, "reddit_template_final.png"), os.path.join(assets_dir, "template.png"))
+    for name in ("peter.png", "brian.png"): shutil.copy(os.path.join(STATIC_DIR, name), os.path.join(assets_dir, name))
+    for name in ("Inter-SemiBold.ttf", "Inter-Bold.ttf"): shutil.copy(os.path.join(STATIC_DIR, "Inter-SemiBold.ttf"), os.path.join(assets_dir, name))
+    for name, color in (("pfp.png", (255, 69, 0, 255)), ("checkmark.png", (0, 121, 211, 255)), ("error.png", (200, 0, 0, 255))): PILImage.new("RGBA", (128, 128), color).save(os.path.join(assets_dir, name))
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30", "-t", str(bg_seconds), "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-g", "60", os.path.join(assets_dir, "background.mp4")], check=True)
+    return {"reddit_template": "template.png", "verified_checkmark": "checkmark.png", "default_pfp": "pfp.png", "error_preview": "error.png", "peter_char": "peter.png", "brian_char": "brian.png", "font_semibold": "Inter-SemiBold.ttf", "font_bold": "Inter-Bold.ttf"}
+
+def print_report(label, total_seconds, timings):
+    print(f"\n{label}: {total_seconds:.2f}s total")
+    for name, record in timings.items():
+        fps = f"  {record['fps']:.1f} fps" if "fps" in record else ""
+        print(f"  {name:<15}{record['seconds']:>8.3f}s{fps}")
+    print(f"  peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB (self), {resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024:.0f} MB (largest child)")
+
+def bench_pipeline(args):
+    import imageio_ffmpeg
+    ffmpeg = os.getenv("FFMPEG_BINARY") or imageio_ffmpeg.get_ffmpeg_exe(); work_dir = tempfile.mkdtemp(prefix="makeaclip-bench-")
+    assets_dir = os.path.join(work_dir, "assets"); uploads_dir = os.path.join(work_dir, "uploads"); os.makedirs(assets_dir); os.makedirs(uploads_dir)
+    asset_names = build_stub_assets(assets_dir, ffmpeg, args.size, args.bg_seconds)
+    StubHandler.assets_dir, StubHandler.ffmpeg = assets_dir, ffmpeg
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler); threading.Thread(target=server.serve_forever, daemon=True).start(); base = f"http://127.0.0.1:{server.server_port}"
+    os.environ.update({"ELEVENLABS_API_BASE": base, "ELEVENLABS_API_KEY": "stub", "ASSET_CACHE_DIR": os.path.join(work_dir, "cache"), "TTS_CACHE": "0"})
+
+    import tasks, metrics
+    for key, name in asset_names.items(): tasks.ASSET_URLS[key] = f"{base}/assets/{name}"
+    for key in tasks.BACKGROUND_VIDEO_URLS: tasks.BACKGROUND_VIDEO_URLS[key] = f"{base}/assets/background.mp4"
+    # Cloudinary stub: keep the rendered file locally instead of uploading it.
+    def upload(path, **kwargs):
+        dest = os.path.join(uploads_dir, os.path.basename(path)); shutil.copy(path, dest); return {"secure_url": f"file://{dest}"}
+    tasks.cloudinary.uploader.upload = upload
+
+    rng = random.Random(0)
+    reddit_data = {"title": "My roommate keeps eating my leftovers, what should I do?", "body": " ".join(rng.choice(WORDS) for _ in range(args.words)), "username": "u/benchmark", "subreddit": "r/stories", "is_verified": True}
+    dialogue = [{"character": ("peter", "brian")[i % 2], "text": " ".join(rng.choice(WORDS) for _ in range(12)), "imagePlacement": "center"} for i in range(args.lines)]
+    try:
+        for run in range(args.runs):
+            for label, task, data, options in (("reddit", tasks.create_reddit_video_task, reddit_data, {"template": "reddit", "word_group_size": 3}), ("character", tasks.create_video_task, dialogue, {"template": "character"})):
+                if args.cold: tasks.get_asset_cache().clear()
+                metrics.local_timings.clear(); started = time.perf_counter(); task(data, options)
+                print_report(f"{label} run {run + 1} ({tasks.RENDER_BACKEND} backend)", time.perf_counter() - started, dict(metrics.local_timings))
+    finally: server.shutdown(); shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the render pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("subtitles", help="Caption setup time: Pillow renderer vs ImageMagick TextClip.")
+    p.add_argument("--chunks", type=int, default=300); p.add_argument("--word-group-size", type=int, default=3)
+    p.add_argument("--width", type=int, default=918); p.add_argument("--size-multiplier", type=float, default=1.0)
+    p.add_argument("--skip-textclip", action="store_true"); p.set_defaults(func=bench_subtitles)
+    p = commands.add_parser("pipeline", help="End-to-end task runs against stub ElevenLabs/asset servers and a local upload stub.")
+    p.add_argument("--runs", type=int, default=1); p.add_argument("--words", type=int, default=250, help="Reddit body length in words.")
+    p.add_argument("--lines", type=int, default=10, help="Dialogue lines for the character task."); p.add_argument("--size", default="720x1280", help="Synthetic background size.")
+    p.add_argument("--bg-seconds", type=int, default=120); p.add_argument("--cold", action="store_true", help="Empty the asset cache before every run.")
+    p.set_defaults(func=bench_pipeline)
+    args = parser.parse_args(); args.func(args)
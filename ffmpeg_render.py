@@ -0,0 +1,78 @@
+import os
+import random
+import subprocess
+import imageio_ffmpeg
+from functools import lru_cache
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+# --- Direct ffmpeg render backend ---
+# Compiles a timeline (background, audio track, timed image overlays) into one filter_complex
+# invocation so compositing and encoding happen inside ffmpeg instead of frame-by-frame in Python.
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY") or imageio_ffmpeg.get_ffmpeg_exe()
+FFMPEG_PRESET = os.getenv("FFMPEG_PRESET", "veryfast")
+FFMPEG_CRF = os.getenv("FFMPEG_CRF", "23")
+FFMPEG_THREADS = os.getenv("FFMPEG_THREADS", "0")  # 0 lets x264 use every core
+
+# Same keyword shorthands MoviePy accepts in set_position().
+NAMED_POSITIONS = {"center": ("center", "center"), "left": ("left", "center"), "right": ("right", "center"), "top": ("center", "top"), "bottom": ("center", "bottom")}
+
+def _axis_expr(value, main, over, relative):
+    if isinstance(value, str): return {"center": f"({main}-{over})/2", "left": "0", "top": "0", "right": f"{main}-{over}", "bottom": f"{main}-{over}"}[value]
+    return f"{value}*{main}" if relative else str(value)
+
+def position_exprs(position, relative=False):
+    if isinstance(position, str): position = NAMED_POSITIONS[position]
+    return _axis_expr(position[0], "W", "w", relative), _axis_expr(position[1], "H", "h", relative)
+
+def build_filter_graph(overlays, fps):
+    # Input 0 is the background, input 1 the audio, inputs 2.. the overlay images (one decoded frame each;
+    # overlay's default eof_action=repeat keeps it on screen and `enable` gates it to its time window).
+    lines = [f"[0:v]fps={fps},setpts=PTS-STARTPTS[v0]"]
+    for i, layer in enumerate(overlays):
+        src = f"[{i + 2}:v]"
+        if layer.get("width") or layer.get("height"):
+            lines.append(f"{src}scale={layer.get('width') or -1}:{layer.get('height') or -1}[s{i}]"); src = f"[s{i}]"
+        x, y = position_exprs(layer.get("position", "center"), layer.get("relative", False))
+        lines.append(f"[v{i}]{src}overlay=x={x}:y={y}:enable='between(t,{layer['start']:.3f},{layer['end']:.3f})'[v{i + 1}]")
+    lines.append(f"[v{len(overlays)}]format=yuv420p[vout]")
+    return ";\n".join(lines)
+
+def render_timeline(background_path, audio_path, duration, overlays, output_path, fps=24, background_start=0.0, preset=None, crf=None, threads=None, on_progress=None):
+    script_path = output_path + ".filtergraph"
+    with open(script_path, "w") as f: f.write(build_filter_graph(overlays, fps))
+    # Input-side -ss/-t seeks straight to the background window without decoding what comes before it.
+    # -progress writes key=value blocks (including frame=N) to stdout as encoding proceeds.
+    cmd = [FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error", "-nostats", "-progress", "pipe:1", "-ss", f"{background_start:.3f}", "-t", f"{duration:.3f}", "-i", background_path, "-i", audio_path]
+    for layer in overlays: cmd += ["-i", layer["path"]]
+    cmd += ["-filter_complex_script", script_path, "-map", "[vout]", "-map", "1:a",
+            "-c:v", "libx264", "-preset", preset or FFMPEG_PRESET, "-crf", str(crf or FFMPEG_CRF), "-threads", str(threads if threads is not None else FFMPEG_THREADS),
+            "-c:a", "aac", "-t", f"{duration:.3f}", "-movflags", "+faststart", output_path]
+    total_frames = int(duration * fps)
+    try:
+        # stderr only carries errors at -loglevel error, so reading it after stdout can't fill the pipe and stall ffmpeg.
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for line in proc.stdout:
+            if on_progress and line.startswith("frame="): on_progress(int(line[6:]), total_frames)
+        stderr = proc.stderr.read()
+        if proc.wait(): raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+    finally: os.remove(script_path)
+    return output_path
+
+# --- Ranged background fetches ---
+# ffmpeg reads remote mp4s with HTTP range requests, so seeking and stream-copying a window only
+# transfers the container index plus the bytes for that window instead of the whole file.
+@lru_cache(maxsize=64)
+def probe_duration(source): return ffmpeg_parse_infos(source)["duration"]
+
+def fetch_segment(url, duration, output_path, start=None, margin=1.0):
+    # Random offsets (when start is None) sample different parts of long backgrounds across jobs. The cut
+    # lands on the keyframe at or before `start`, and `margin` keeps the clip at least `duration` long.
+    if start is None: start = random.uniform(0, max(0.0, probe_duration(url) - duration - margin))
+    cmd = [FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error", "-ss", f"{start:.3f}", "-i", url, "-t", f"{duration + margin:.3f}",
+           "-map", "0:v:0", "-c", "copy", "-avoid_negative_ts", "make_zero", output_path]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # A server that ignores Range, or a read cut short, still exits 0 but leaves an empty or short mp4.
+    infos = ffmpeg_parse_infos(output_path)
+    if not infos.get("video_found") or infos.get("duration", 0) < duration:
+        raise ValueError(f"Ranged fetch of {url} produced {infos.get('duration', 0):.2f}s of video, needed {duration:.2f}s")
+    return output_path
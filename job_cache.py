@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import argparse
+import redis
+import job_events
+
+# --- Render deduplication & result cache ---
+# Jobs are keyed on a canonical hash of everything that affects the rendered video. Identical in-flight
+# requests are coalesced onto one job id, and finished results are kept in Redis for a tier-dependent TTL.
+# Tier is part of the key and each tier has its own generation counter, so one tier's cache can be
+# invalidated (e.g. when its output changes) without touching the others.
+RENDER_CACHE_TTLS = {"free": int(os.getenv("RENDER_CACHE_TTL_FREE", str(6 * 3600))), "pro": int(os.getenv("RENDER_CACHE_TTL_PRO", str(24 * 3600))), "platinum": int(os.getenv("RENDER_CACHE_TTL_PLATINUM", str(7 * 24 * 3600)))}
+CACHED_JOB_PREFIX = "cached-"
+INFLIGHT_TTL = int(os.getenv("RENDER_INFLIGHT_TTL", "2400"))  # upper bound on queue wait + render; a crashed job can't pin its spec past this
+ACTIVE_STATUSES = ("queued", "started", "deferred", "scheduled")
+OPTION_DEFAULTS = {
+    "reddit": {"backgroundVideo": "minecraft_parkour1", "word_group_size": 3, "subtitle_size_multiplier": 1.0, "narrator_voice": "reddit_default"},
+    "character": {"backgroundVideo": "minecraft_parkour1", "subtitle_size_multiplier": 1.0},
+}
+
+def _inflight_key(spec_hash): return f"render:inflight:{spec_hash}"
+def _result_key(spec_hash): return f"render:result:{spec_hash}"
+def _generation_key(tier): return f"render:generation:{tier}"
+
+def job_spec_hash(conn, template: str, data, options: dict, tier: str):
+    # Only options the task actually reads are hashed, with defaults filled in, so an omitted option and its default collide.
+    opts = {key: options.get(key, default) for key, default in OPTION_DEFAULTS.get(template, {}).items()}
+    if "subtitle_size_multiplier" in opts: opts["subtitle_size_multiplier"] = round(float(opts["subtitle_size_multiplier"]), 3)
+    generation = int(conn.get(_generation_key(tier)) or 0)
+    spec = {"template": template, "tier": tier, "generation": generation, "data": data, "options": opts}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+def cache_ttl(tier: str): return RENDER_CACHE_TTLS.get(tier, RENDER_CACHE_TTLS["free"])
+
+def get_cached_result(conn, spec_hash):
+    cached = conn.get(_result_key(spec_hash))
+    return json.loads(cached) if cached else None
+
+def get_inflight_job_id(conn, spec_hash):
+    job_id = conn.get(_inflight_key(spec_hash))
+    return job_id.decode() if job_id else None
+
+def claim_inflight(conn, spec_hash, job_id, ttl=INFLIGHT_TTL):
+    return bool(conn.set(_inflight_key(spec_hash), job_id, ex=ttl, nx=True))
+
+def replace_inflight(conn, spec_hash, stale_job_id, job_id, ttl=INFLIGHT_TTL):
+    # Takes over a claim whose job already ended, but only if nobody else has replaced it first.
+    with conn.pipeline() as pipe:
+        try:
+            pipe.watch(_inflight_key(spec_hash))
+            current = pipe.get(_inflight_key(spec_hash))
+            if current is not None and current.decode() != stale_job_id: return False
+            pipe.multi(); pipe.set(_inflight_key(spec_hash), job_id, ex=ttl); pipe.execute(); return True
+        except redis.WatchError: return False
+
+def invalidate_tier(conn, tier: str): return conn.incr(_generation_key(tier))
+
+def release_inflight(conn, spec_hash, job_id):
+    if spec_hash and get_inflight_job_id(conn, spec_hash) == job_id: conn.delete(_inflight_key(spec_hash))
+
+# RQ callbacks, run in the worker after the job finishes. They also push the terminal status to /api/job-events.
+def on_render_success(job, connection, result, *args, **kwargs):
+    spec_hash = job.meta.get("spec_hash")
+    if spec_hash and result: connection.set(_result_key(spec_hash), json.dumps(result), ex=cache_ttl(job.meta.get("tier", "free")))
+    release_inflight(connection, spec_hash, job.id); job_events.publish(connection, job.id, "finished", "Done!", percent=100, result=result)
+
+def on_render_failure(job, connection, *exc_info, **kwargs):
+    release_inflight(connection, job.meta.get("spec_hash"), job.id)
+    error = exc_info[1] if len(exc_info) > 1 else None; job_events.publish(connection, job.id, "failed", f"Job Failed: {error or 'Unknown error'}")
+
+# Usage: python job_cache.py invalidate pro   (after a change to that tier's output, e.g. new watermark or styles)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render cache maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("invalidate", help="Drop every cached render for the given tiers by bumping their generation.")
+    p.add_argument("tiers", nargs="+", choices=sorted(RENDER_CACHE_TTLS))
+    args = parser.parse_args(); conn = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379'))
+    for tier in args.tiers: print(f"{tier}: cache generation is now {invalidate_tier(conn, tier)}")
@@ -0,0 +1,77 @@
+import json
+import time
+import anyio
+from contextlib import contextmanager
+
+# --- Job status hash & progress events ---
+# Workers write each job's latest state to a small Redis hash and publish the same payload on a per-job
+# channel. /api/job-events streams the channel to clients as server-sent events, and /api/job-status
+# reads the hash instead of deserializing the whole RQ job.
+STATUS_TTL = 24 * 3600
+TERMINAL_STATUSES = ("finished", "failed")
+
+def status_key(job_id): return f"job:{job_id}:status"
+def channel(job_id): return f"job:{job_id}:events"
+
+def publish(conn, job_id, status, progress, percent=None, result=None):
+    event = {"status": status, "progress": progress}
+    if percent is not None: event["percent"] = percent
+    if result is not None: event["result"] = result
+    fields = {key: json.dumps(value) if key == "result" else str(value) for key, value in event.items()}
+    pipe = conn.pipeline(transaction=False); pipe.hset(status_key(job_id), mapping=fields)
+    if percent is None: pipe.hdel(status_key(job_id), "percent")
+    pipe.expire(status_key(job_id), STATUS_TTL); pipe.publish(channel(job_id), json.dumps(event)); pipe.execute()
+
+def parse_status(raw):
+    if not raw: return None
+    fields = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v) for k, v in raw.items()}
+    status = {"status": fields.get("status"), "progress": fields.get("progress"), "result": json.loads(fields["result"]) if fields.get("result") else None}
+    if fields.get("percent"): status["percent"] = float(fields["percent"])
+    return status
+
+def get_status(conn, job_id): return parse_status(conn.hgetall(status_key(job_id)))
+
+def render_progress_reporter(conn, job_id, message="Rendering video...", min_interval=0.5):
+    # Returns an on_progress(done, total) callback that publishes at most every `min_interval` seconds, plus on completion.
+    last = {"at": 0.0, "percent": None}
+    def report(done, total):
+        percent = round(100.0 * min(done, total) / total, 1) if total else None; now = time.monotonic()
+        if percent is None or percent == last["percent"] or (now - last["at"] < min_interval and percent < 100): return
+        last["at"], last["percent"] = now, percent; publish(conn, job_id, "started", message, percent=percent)
+    return report
+
+# --- Shared subscriber for /api/job-events ---
+# A pubsub holds a Redis connection for as long as it is subscribed, so one pattern subscription per app
+# process fans events out to per-request memory streams instead of every open SSE stream subscribing itself.
+CHANNEL_PATTERN = channel("*")
+
+class JobEventBroker:
+    def __init__(self, async_conn, buffer_size=64):
+        self.conn = async_conn; self.buffer_size = buffer_size; self.streams = {}; self.ready = anyio.Event()
+
+    async def run(self):
+        # Reconnects after Redis errors; events published while disconnected are recovered by readers re-checking the status hash.
+        while True:
+            pubsub = self.conn.pubsub()
+            try:
+                await pubsub.psubscribe(CHANNEL_PATTERN); self.ready.set()
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage": self._dispatch(message["channel"].decode().split(":")[1], message["data"])
+            except Exception as e: print(f"Job event subscriber lost its Redis connection, reconnecting: {e}"); await anyio.sleep(1)
+            finally:
+                with anyio.CancelScope(shield=True): await pubsub.aclose()
+
+    def _dispatch(self, job_id, data):
+        for stream in list(self.streams.get(job_id, ())):
+            # A client too slow to drain its buffer skips progress updates rather than stalling every other stream.
+            try: stream.send_nowait(data)
+            except (anyio.WouldBlock, anyio.BrokenResourceError, anyio.ClosedResourceError): pass
+
+    @contextmanager
+    def subscribe(self, job_id):
+        send, receive = anyio.create_memory_object_stream(self.buffer_size); self.streams.setdefault(job_id, set()).add(send)
+        try: yield receive
+        finally:
+            self.streams[job_id].discard(send)
+            if not self.streams[job_id]: del self.streams[job_id]
+            send.close(); receive.close()
@@ -2,25 +2,31 @@ import os
 import json
 import stripe
 import anyio
-import shutil
+import asyncio
 import time
+import uuid
 import requests
 from authlib.integrations.starlette_client import OAuth
 from fastapi import FastAPI, Request, Body, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse, Response, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 from rq import Queue
 import redis
+import redis.asyncio
 
 # --- Import from our definitive tasks.py ---
 from tasks import (
     PREMIUM_STYLES, 
     create_video_task, 
-    create_reddit_video_task, 
-    create_reddit_preview_image
+    create_reddit_video_task
 )
+from preview import RedditPreviewRenderer
+import job_cache
+import scheduler
+import metrics
+import job_events
 
 # --- NEW: Import for Auth0 Management ---
 from auth0.management import Auth0
@@ -39,7 +45,9 @@ REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 AUTH0_MGMT_CLIENT_ID = os.getenv('AUTH0_MGMT_CLIENT_ID')
 AUTH0_MGMT_CLIENT_SECRET = os.getenv('AUTH0_MGMT_CLIENT_SECRET')
 
-conn = redis.from_url(REDIS_URL); q = Queue(connection=conn)
+# The async client only carries the shared job-event subscription, so a small blocking pool is plenty.
+REDIS_ASYNC_MAX_CONNECTIONS = int(os.getenv('REDIS_ASYNC_MAX_CONNECTIONS', '4'))
+conn = redis.from_url(REDIS_URL); async_conn = redis.asyncio.Redis(connection_pool=redis.asyncio.BlockingConnectionPool.from_url(REDIS_URL, max_connections=REDIS_ASYNC_MAX_CONNECTIONS)); queues = {name: Queue(name, connection=conn) for name in scheduler.listen_order()}
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
@@ -70,6 +78,33 @@ class Auth0ManagementTokenProvider:
 auth0_token_provider = Auth0ManagementTokenProvider(AUTH0_DOMAIN, AUTH0_MGMT_CLIENT_ID, AUTH0_MGMT_CLIENT_SECRET)
 auth0_mgmt_client = Auth0(AUTH0_DOMAIN, auth0_token_provider.get_token())
 
+# --- Reddit preview renderer: assets decoded once per app process, rendering off the event loop ---
+# Loaded at startup, but a failed asset download only disables previews: requests get a 503 and retry
+# the load at most every PREVIEW_RETRY_SECONDS until it succeeds.
+PREVIEW_RETRY_SECONDS = int(os.getenv("PREVIEW_RETRY_SECONDS", "30"))
+preview_renderer, preview_failed_at, preview_lock = None, float("-inf"), anyio.Lock()  # monotonic() can be below the retry window right after boot
+async def get_preview_renderer():
+    global preview_renderer, preview_failed_at
+    if preview_renderer or time.monotonic() - preview_failed_at < PREVIEW_RETRY_SECONDS: return preview_renderer
+    async with preview_lock:
+        if preview_renderer or time.monotonic() - preview_failed_at < PREVIEW_RETRY_SECONDS: return preview_renderer
+        try: preview_renderer = await anyio.to_thread.run_sync(RedditPreviewRenderer)
+        except Exception as e: print(f"ERROR: Could not load preview assets: {e}"); preview_failed_at = time.monotonic()
+    return preview_renderer
+
+@app.on_event("startup")
+async def load_preview_renderer(): await get_preview_renderer()
+
+# --- Job events: one Redis subscription per app process, shared by every open /api/job-events stream ---
+job_event_broker, job_event_task = None, None
+@app.on_event("startup")
+async def start_job_event_broker():
+    global job_event_broker, job_event_task
+    job_event_broker = job_events.JobEventBroker(async_conn); job_event_task = asyncio.create_task(job_event_broker.run())
+@app.on_event("shutdown")
+async def stop_job_event_broker():
+    if job_event_task: job_event_task.cancel()
+
 # --- User Session, Page Routes, and Auth Routes ---
 async def get_user(request: Request): return request.session.get('user')
 @app.get("/", response_class=HTMLResponse)
@@ -88,11 +123,10 @@ async def callback(request: Request): token = await oauth.auth0.authorize_access
 # --- API Routes ---
 @app.post("/api/generate-reddit-preview")
 async def generate_reddit_preview(data: dict = Body(...)):
-    temp_dir = None
-    try: image_path = create_reddit_preview_image(data); temp_dir = os.path.dirname(image_path); return FileResponse(image_path, media_type="image/png")
+    preview_renderer = await get_preview_renderer()
+    if not preview_renderer: raise HTTPException(status_code=503, detail="Preview is temporarily unavailable.", headers={"Retry-After": str(PREVIEW_RETRY_SECONDS)})
+    try: png = await anyio.to_thread.run_sync(preview_renderer.render_png, data); return Response(content=png, media_type="image/png")
     except Exception as e: print(f"Error generating preview: {e}"); raise HTTPException(status_code=500, detail="Failed to generate preview image.")
-    finally:
-        if temp_dir and os.path.exists(temp_dir): await anyio.to_thread.run_sync(shutil.rmtree, temp_dir)
 
 @app.post("/api/create-checkout-session")
 async def create_checkout_session(request: Request, payload: dict = Body(...), user: dict = Depends(get_user)):
@@ -124,25 +158,94 @@ async def stripe_webhook(request: Request):
 @app.post("/api/generate-video")
 async def queue_video_task(request: Request, payload: dict = Body(...), user: dict = Depends(get_user)):
     if not user: raise HTTPException(status_code=401, detail="Not authenticated")
-    options = payload.get("options", {}); user_tier = user.get("https://makeaclip.pro/tier", "free")
+    options = payload.get("options", {}); user_tier = scheduler.normalize_tier(user.get("https://makeaclip.pro/tier", "free"))
     template = options.get("template")
     
     # Logic to route to the correct task with the correct data payload
-    if template == "reddit":
-        job = q.enqueue(create_reddit_video_task, payload.get("reddit_data", {}), options, job_timeout='5m')
-    elif template == "character":
-        job = q.enqueue(create_video_task, payload.get("dialogue_data", []), options, job_timeout='5m')
+    if template == "reddit": task, data = create_reddit_video_task, payload.get("reddit_data", {})
+    elif template == "character": task, data = create_video_task, payload.get("dialogue_data", [])
     else: raise HTTPException(status_code=400, detail="Invalid template specified.")
     
+    # Identical specs are served from the render cache or coalesced onto the job already rendering them.
+    spec_hash = job_cache.job_spec_hash(conn, template, data, options, user_tier)
+    if job_cache.get_cached_result(conn, spec_hash): return JSONResponse({"job_id": f"{job_cache.CACHED_JOB_PREFIX}{spec_hash}"})
+    job_id = uuid.uuid4().hex
+    while not job_cache.claim_inflight(conn, spec_hash, job_id):
+        # A live claim whose job can't be fetched yet is still being enqueued by another request: join it.
+        claimed_id = job_cache.get_inflight_job_id(conn, spec_hash)
+        if not claimed_id: continue
+        existing = scheduler.fetch_job(conn, claimed_id)
+        if not existing or existing.get_status() in job_cache.ACTIVE_STATUSES: return JSONResponse({"job_id": claimed_id})
+        if job_cache.replace_inflight(conn, spec_hash, claimed_id, job_id): break
+    # Published as soon as the claim is ours, so requests that joined it always find a status, and before
+    # enqueueing so it can never land after (and overwrite) the worker's "started".
+    job_events.publish(conn, job_id, "queued", "In queue...")
+    # Per-user cap, checked after dedup so resubmitting a job that is already rendering never counts against it.
+    if not scheduler.reserve_slot(conn, user['sub'], user_tier, job_id):
+        detail = "You already have the maximum number of videos rendering. Please wait for one to finish."
+        job_events.publish(conn, job_id, "failed", f"Job Failed: {detail}"); job_cache.release_inflight(conn, spec_hash, job_id); raise HTTPException(status_code=429, detail=detail)
+    try:
+        job = queues[scheduler.queue_name(template, user_tier)].enqueue(task, data, options, job_id=job_id, job_timeout=scheduler.estimate_timeout(template, data), meta={"spec_hash": spec_hash, "tier": user_tier},
+                        on_success=job_cache.on_render_success, on_failure=job_cache.on_render_failure)
+    except Exception as e:
+        scheduler.release_slot(conn, user['sub'], job_id); job_cache.release_inflight(conn, spec_hash, job_id); job_events.publish(conn, job_id, "failed", f"Job Failed: {e}"); raise
+    
     return JSONResponse({"job_id": job.id})
 
 @app.get("/api/job-status/{job_id}")
 async def get_job_status(job_id: str):
-    job = q.fetch_job(job_id);
+    if job_id.startswith(job_cache.CACHED_JOB_PREFIX):
+        result = job_cache.get_cached_result(conn, job_id[len(job_cache.CACHED_JOB_PREFIX):])
+        if not result: raise HTTPException(status_code=404, detail="Job not found.")
+        return JSONResponse({"status": "finished", "progress": "Done (cached).", "result": result})
+    # Status hash first; only jobs enqueued before it existed need the full RQ job fetch.
+    status = scheduler.reconcile_status(conn, job_id)
+    if status: return JSONResponse(status)
+    job = scheduler.fetch_job(conn, job_id);
     if not job: raise HTTPException(status_code=404, detail="Job not found.")
     response = {"status": job.get_status(), "progress": job.meta.get('progress', 'In queue...'), "result": job.result}
     if job.is_failed: response["progress"] = f"Job Failed: {job.exc_info or 'Unknown error'}"
     return JSONResponse(response)
 
+@app.get("/api/job-events/{job_id}")
+async def stream_job_events(job_id: str):
+    # Server-sent events: the current status first, then every update the worker publishes, until the job finishes or fails.
+    def sse(event): return f"data: {json.dumps(event)}\n\n"
+    initial = None
+    if job_id.startswith(job_cache.CACHED_JOB_PREFIX):
+        result = job_cache.get_cached_result(conn, job_id[len(job_cache.CACHED_JOB_PREFIX):])
+        if not result: raise HTTPException(status_code=404, detail="Job not found.")  # expired or evicted since the id was handed out
+        initial = {"status": "finished", "progress": "Done (cached).", "result": result}
+    elif not conn.exists(job_events.status_key(job_id)):
+        # Jobs enqueued before status hashes existed: answer once from the RQ job if it has already ended.
+        job = scheduler.fetch_job(conn, job_id)
+        if not job: raise HTTPException(status_code=404, detail="Job not found.")
+        if job.is_finished: initial = {"status": "finished", "progress": "Done!", "result": job.result}
+        elif job.is_failed: initial = {"status": "failed", "progress": f"Job Failed: {job.exc_info or 'Unknown error'}"}
+    async def events():
+        if initial: yield sse(initial); return
+        with anyio.move_on_after(5): await job_event_broker.ready.wait()  # if Redis is down, fall back to the 15s status re-checks
+        with job_event_broker.subscribe(job_id) as updates:
+            # Read the snapshot after subscribing so no update can slip between the two.
+            status = await anyio.to_thread.run_sync(scheduler.reconcile_status, conn, job_id)
+            if status:
+                yield sse(status)
+                if status["status"] in job_events.TERMINAL_STATUSES: return
+            while True:
+                data = None
+                with anyio.move_on_after(15): data = await updates.receive()
+                if data is None:
+                    # Quiet for a while: make sure the worker didn't die mid-render, and pick up a terminal status
+                    # this stream missed (full buffer, subscriber reconnecting) from the hash.
+                    status = await anyio.to_thread.run_sync(scheduler.reconcile_status, conn, job_id)
+                    if status and status["status"] in job_events.TERMINAL_STATUSES: yield sse(status); return
+                    yield ": keepalive\n\n"; continue
+                event = json.loads(data); yield sse(event)
+                if event["status"] in job_events.TERMINAL_STATUSES: return
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(): return PlainTextResponse(await anyio.to_thread.run_sync(metrics.render_prometheus, conn), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check(): return {"status": "ok"}
@@ -0,0 +1,56 @@
+import time
+import resource
+from contextlib import contextmanager
+from rq import get_current_job
+
+# --- Pipeline stage instrumentation ---
+# Each stage's duration and peak RSS are written to job.meta['timings'] and added to Redis-backed
+# histograms, which main.py exposes at /metrics in Prometheus text format. Outside an RQ job (e.g. the
+# benchmark harness) timings are collected in `local_timings` instead.
+STAGES = ("asset_download", "tts", "transcription", "subtitle_build", "composite", "encode", "encode_failed", "upload")
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+local_timings = {}
+
+def _rss_mb(who): return resource.getrusage(who).ru_maxrss / 1024
+def _histogram_key(name): return f"metrics:stage:{name}"
+
+def observe(conn, name, seconds):
+    pipe = conn.pipeline(transaction=False); key = _histogram_key(name)
+    for bound in BUCKETS:
+        if seconds <= bound: pipe.hincrby(key, f"le:{bound}", 1)
+    pipe.hincrby(key, "le:+Inf", 1); pipe.hincrby(key, "count", 1); pipe.hincrbyfloat(key, "sum", seconds); pipe.execute()
+
+@contextmanager
+def stage(name, failed_as=None):
+    # Yields a dict the caller may add fields to; "frames" additionally derives frames/sec.
+    # With failed_as, a block that raises is recorded under that name instead, e.g. an encode that falls back.
+    extra = {}; started = time.perf_counter()
+    try: yield extra
+    except BaseException:
+        if failed_as: name = failed_as; extra.pop("frames", None)  # no frames/sec for an attempt that didn't finish
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        record = {"seconds": round(seconds, 3), "max_rss_mb": round(_rss_mb(resource.RUSAGE_SELF)), "children_max_rss_mb": round(_rss_mb(resource.RUSAGE_CHILDREN)), **extra}
+        if extra.get("frames"): record["fps"] = round(extra["frames"] / max(seconds, 1e-9), 1)
+        job = get_current_job()
+        if job is None:
+            # Repeated stages (e.g. several asset downloads) accumulate.
+            if name in local_timings: record["seconds"] = round(local_timings[name]["seconds"] + seconds, 3)
+            local_timings[name] = record
+        else:
+            timings = job.meta.setdefault("timings", {})
+            if name in timings: record["seconds"] = round(timings[name]["seconds"] + seconds, 3)
+            timings[name] = record; job.save_meta()
+            try: observe(job.connection, name, seconds)
+            except Exception as e: print(f"Could not record metrics for stage {name}: {e}")
+
+def render_prometheus(conn):
+    lines = ["# HELP makeaclip_stage_seconds Time spent in each render pipeline stage.", "# TYPE makeaclip_stage_seconds histogram"]
+    for name in STAGES:
+        data = {k.decode(): v.decode() for k, v in conn.hgetall(_histogram_key(name)).items()}
+        if not data: continue
+        for bound in BUCKETS: lines.append(f'makeaclip_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {data.get(f"le:{bound}", 0)}')
+        lines.append(f'makeaclip_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {data.get("le:+Inf", 0)}')
+        lines.append(f'makeaclip_stage_seconds_sum{{stage="{name}"}} {data.get("sum", 0)}'); lines.append(f'makeaclip_stage_seconds_count{{stage="{name}"}} {data.get("count", 0)}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,53 @@
+import os
+import io
+import json
+import threading
+from collections import OrderedDict
+from tasks import ASSET_URLS, get_asset_cache, load_pfp, load_reddit_post_assets, draw_reddit_post
+
+# --- In-process Reddit preview renderer ---
+# Template, default PFP, checkmark and fonts are decoded once at app startup. Each preview is drawn on a
+# copy of the template and returned as PNG bytes, and results are LRU-cached by the normalized payload
+# because the editor re-requests the same post on every keystroke.
+PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", "1024"))
+PFP_CACHE_SIZE = int(os.getenv("PREVIEW_PFP_CACHE_SIZE", "256"))
+PREVIEW_FIELDS = ("pfp_url", "subreddit", "username", "title", "is_verified", "upvotes", "comments")
+
+class RedditPreviewRenderer:
+    def __init__(self, cache_size=PREVIEW_CACHE_SIZE):
+        self.assets = load_reddit_post_assets(); self.error_png = open(get_asset_cache().fetch_url(ASSET_URLS["error_preview"]), "rb").read()
+        self.cache_size = cache_size; self.results = OrderedDict(); self.pfps = OrderedDict(); self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(data: dict):
+        spec = {field: data[field] for field in PREVIEW_FIELDS if data.get(field) is not None}
+        spec["is_verified"] = bool(spec.get("is_verified")); return spec
+
+    def _lru_get(self, store, key):
+        with self.lock:
+            if key in store: store.move_to_end(key); return store[key]
+        return None
+
+    def _lru_put(self, store, key, value, limit):
+        with self.lock:
+            store[key] = value; store.move_to_end(key)
+            while len(store) > limit: store.popitem(last=False)
+
+    def _pfp(self, url):
+        if not url or "http" not in url: return None
+        pfp = self._lru_get(self.pfps, url)
+        if pfp is None:
+            # A PFP that fails to load is remembered as the default until it ages out, instead of being refetched per keystroke.
+            try: pfp = load_pfp(get_asset_cache().fetch_url(url))
+            except Exception as e: print(f"Could not download user PFP: {e}"); pfp = self.assets["pfp"]
+            self._lru_put(self.pfps, url, pfp, PFP_CACHE_SIZE)
+        return pfp
+
+    def render_png(self, data: dict):
+        spec = self.normalize(data); key = json.dumps(spec, sort_keys=True)
+        png = self._lru_get(self.results, key)
+        if png is not None: return png
+        try:
+            buf = io.BytesIO(); draw_reddit_post(spec, self.assets, self._pfp(spec.get("pfp_url"))).save(buf, "PNG", compress_level=1); png = buf.getvalue()
+        except Exception as e: print(f"Error in preview generation: {e}"); return self.error_png
+        self._lru_put(self.results, key, png, self.cache_size); return png
@@ -0,0 +1,82 @@
+import os
+import redis
+from rq.job import Job
+from rq.exceptions import NoSuchJobError
+import job_cache
+import job_events
+from job_cache import ACTIVE_STATUSES
+
+# --- Queue layout & scheduling policy ---
+# One queue per (template, tier). Workers listen tier-first, and RQ always dequeues from the first
+# non-empty queue in its list, so platinum work is picked up before pro, and pro before free.
+TIER_PRIORITY = ("platinum", "pro", "free")
+TEMPLATES = ("reddit", "character")
+LEGACY_QUEUES = ("default",)  # drained last so jobs enqueued before the split still run
+USER_CONCURRENCY_LIMITS = {"free": int(os.getenv("MAX_ACTIVE_JOBS_FREE", "1")), "pro": int(os.getenv("MAX_ACTIVE_JOBS_PRO", "3")), "platinum": int(os.getenv("MAX_ACTIVE_JOBS_PLATINUM", "5"))}
+
+def normalize_tier(tier): return tier if tier in TIER_PRIORITY else "free"
+def queue_name(template: str, tier: str): return f"{template}-{normalize_tier(tier)}"
+def listen_order(templates=TEMPLATES): return [queue_name(template, tier) for tier in TIER_PRIORITY for template in templates] + list(LEGACY_QUEUES)
+
+# --- Job timeouts ---
+# Narration runs at roughly 15 characters per second of audio. The render step takes a few times the
+# audio length on a worker, and a fixed overhead covers TTS, downloads and upload.
+CHARS_PER_AUDIO_SECOND = 15
+RENDER_SECONDS_PER_AUDIO_SECOND = float(os.getenv("RENDER_SECONDS_PER_AUDIO_SECOND", "3"))
+MIN_JOB_TIMEOUT, MAX_JOB_TIMEOUT = 180, int(os.getenv("MAX_JOB_TIMEOUT", "1800"))
+
+def script_length(template: str, data):
+    if template == "reddit": return len(data.get("title", "")) + len(data.get("body", ""))
+    return sum(len(line.get("text", "")) for line in data)
+
+def estimate_timeout(template: str, data):
+    audio_seconds = script_length(template, data) / CHARS_PER_AUDIO_SECOND
+    return int(min(MAX_JOB_TIMEOUT, max(MIN_JOB_TIMEOUT, 120 + audio_seconds * (1 + RENDER_SECONDS_PER_AUDIO_SECOND))))
+
+# --- Per-user concurrency caps ---
+def _active_key(user_id): return f"render:active:{user_id}"
+
+def active_job_ids(conn, user_id):
+    # Finished, failed and expired jobs are pruned on read, so a crashed worker can't leave a user locked out.
+    # A reserved id with no RQ job yet is still being enqueued as long as its status hash says "queued".
+    job_ids = [job_id.decode() for job_id in conn.smembers(_active_key(user_id))]
+    active = [job_id for job_id, job in zip(job_ids, Job.fetch_many(job_ids, connection=conn))
+              if (job.get_status() in ACTIVE_STATUSES if job else (job_events.get_status(conn, job_id) or {}).get("status") == "queued")]
+    stale = set(job_ids) - set(active)
+    if stale: conn.srem(_active_key(user_id), *stale)
+    return active
+
+def reserve_slot(conn, user_id, tier: str, job_id):
+    # Check-and-add under WATCH, so concurrent submissions can't both take a user's last slot.
+    key = _active_key(user_id)
+    with conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                if len(active_job_ids(conn, user_id)) >= USER_CONCURRENCY_LIMITS[normalize_tier(tier)]: return False
+                pipe.multi(); pipe.sadd(key, job_id); pipe.expire(key, MAX_JOB_TIMEOUT * 2); pipe.execute(); return True
+            except redis.WatchError: continue  # another submission (or our own pruning) changed the set; re-check
+
+def release_slot(conn, user_id, job_id): conn.srem(_active_key(user_id), job_id)
+
+def fetch_job(conn, job_id):
+    # Queue.fetch_job only finds jobs that originated in that queue; status lookups span all of them.
+    try: return Job.fetch(job_id, connection=conn)
+    except NoSuchJobError: return None
+
+# --- Lost jobs ---
+# RQ never runs on_failure when the work horse is killed (OOM, SIGKILL) or the whole worker dies, which
+# would leave the status hash "started" until it expires. Readers check RQ's own status for non-terminal
+# hashes and publish the failure themselves once RQ has given up on the job.
+RQ_FAILED_STATUSES = ("failed", "stopped", "canceled")
+
+def reconcile_status(conn, job_id, status=None):
+    status = status or job_events.get_status(conn, job_id)
+    if not status or status["status"] in job_events.TERMINAL_STATUSES: return status
+    rq_status = Job(job_id, connection=conn).get_status()  # a single HGET, not a full job fetch
+    if rq_status is None and status["status"] != "queued": job_events.publish(conn, job_id, "failed", "Job Failed: the job was lost.")
+    elif rq_status in RQ_FAILED_STATUSES:
+        job = fetch_job(conn, job_id)
+        if job: job_cache.on_render_failure(job, conn, None, (job.exc_info or "Unknown error").strip().splitlines()[-1])
+    else: return status
+    return job_events.get_status(conn, job_id)
@@ -0,0 +1,47 @@
+import os
+from functools import lru_cache
+import numpy as np
+from PIL import Image as PILImage, ImageDraw, ImageFont
+from moviepy.editor import ImageClip
+
+# --- Pillow subtitle renderer ---
+# Rasterizes each caption once into an RGBA array with the bundled Inter fonts, instead of
+# shelling out to ImageMagick per chunk the way TextClip(method='caption') does.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# SUBTITLE_STYLES uses ImageMagick font names; map them onto the fonts we ship.
+FONT_FILES = {"Arial-Bold": "Inter-SemiBold.ttf", "Arial": "Inter-Regular.ttf"}
+DEFAULT_FONT_FILE = "Inter-SemiBold.ttf"
+
+@lru_cache(maxsize=32)
+def _load_font(font, fontsize): return ImageFont.truetype(os.path.join(STATIC_DIR, FONT_FILES.get(font, DEFAULT_FONT_FILE)), fontsize)
+
+def _wrap(text, font, max_width):
+    lines, current = [], ""
+    for word in text.split():
+        candidate = f"{current} {word}" if current else word
+        if current and font.getlength(candidate) > max_width: lines.append(current); current = word
+        else: current = candidate
+    if current: lines.append(current)
+    return lines
+
+@lru_cache(maxsize=1024)
+def _render_line(line, font, fontsize, color, stroke_color, stroke_width):
+    f = _load_font(font, fontsize); ascent, descent = f.getmetrics()
+    img = PILImage.new("RGBA", (int(f.getlength(line)) + 2 * stroke_width + 1, ascent + descent + 2 * stroke_width), (0, 0, 0, 0))
+    ImageDraw.Draw(img).text((stroke_width, stroke_width), line, font=f, fill=color, stroke_width=stroke_width, stroke_fill=stroke_color)
+    return img
+
+@lru_cache(maxsize=512)
+def _render_caption(text, font, fontsize, color, stroke_color, stroke_width, width):
+    lines = [_render_line(line, font, fontsize, color, stroke_color, stroke_width) for line in _wrap(text, _load_font(font, fontsize), width - 2 * stroke_width)]
+    if not lines: lines = [PILImage.new("RGBA", (1, 1), (0, 0, 0, 0))]
+    width = max([width] + [line.width for line in lines])
+    canvas = PILImage.new("RGBA", (width, sum(line.height for line in lines)), (0, 0, 0, 0)); y = 0
+    for line in lines: canvas.alpha_composite(line, (max(0, (width - line.width) // 2), y)); y += line.height
+    frame = np.array(canvas); frame.setflags(write=False)  # shared between every clip that hits the cache
+    return frame
+
+def render_caption(text, style, width):
+    return _render_caption(text, style.get("font"), int(style.get("fontsize", 40)), style.get("color", "white"), style.get("stroke_color") or style.get("color", "white"), int(style.get("stroke_width", 0) + 0.5), int(width))
+
+def caption_clip(text, style, width): return ImageClip(render_caption(text, style, width))
@@ -1,4 +1,5 @@
 import os
+import io
 import requests
 import textwrap
 import time
@@ -7,10 +8,20 @@ import cloudinary.uploader
 import PIL.Image
 from PIL import Image as PILImage, ImageDraw, ImageFont
 from moviepy.editor import *
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 from rq import get_current_job
 import tempfile
 import shutil
-import whisper
+import resource
+import proglog
+import subprocess
+import uuid
+from asset_cache import get_asset_cache, link_into
+from subtitles import caption_clip, render_caption
+import ffmpeg_render
+from tts import generate_audio_elevenlabs, generate_audio_with_alignment_elevenlabs, generate_audio_many
+from metrics import stage
+import job_events
 
 # --- Configuration & Asset URLs ---
 if not hasattr(PIL.Image, 'ANTIALIAS'):
@@ -31,8 +42,16 @@ SUBTITLE_STYLES = {
     "standard": {"fontsize": 40, "font": "Arial-Bold", "color": "white", "stroke_color": "black", "stroke_width": 2.5},
 }
 PREMIUM_STYLES = {} # Can be expanded later
+# "pillow" rasterizes captions in-process (subtitles.py); "textclip" keeps the ImageMagick-backed TextClip path.
+SUBTITLE_RENDERER = os.getenv("SUBTITLE_RENDERER", "pillow")
+# "ffmpeg" compiles the timeline into one filter_complex (ffmpeg_render.py); "moviepy" composites frame-by-frame. ffmpeg falls back to MoviePy on failure.
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "ffmpeg")
+# "full" downloads whole backgrounds through the asset cache; "range" pulls only a randomly placed, keyframe-aligned window of the needed length.
+BACKGROUND_FETCH_MODE = os.getenv("BACKGROUND_FETCH_MODE", "full")
 
-ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+# Where word timings come from: "alignment" asks ElevenLabs for character timings alongside the audio, "whisper" transcribes the audio.
+TIMESTAMP_SOURCE = os.getenv("TIMESTAMP_SOURCE", "alignment")
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL", "tiny.en")
 cloudinary.config(cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"), api_key=os.getenv("CLOUDINARY_API_KEY"), api_secret=os.getenv("CLOUDINARY_API_SECRET"), secure=True)
 VOICE_IDS = {"peter": "BrXwCQ7xdzi6T5h2idQP", "brian": "jpuuy9amUxVn651Jjmtq", "reddit_default": "jpuuy9amUxVn651Jjmtq"}
 BACKGROUND_VIDEO_URLS = {
@@ -43,80 +62,174 @@ BACKGROUND_VIDEO_URLS = {
 }
 
 # --- Helper Functions ---
-def update_job_progress(message: str): job = get_current_job(); job.meta['progress'] = message; job.save_meta() if job else None
+def update_job_progress(message: str):
+    # Written to the job's status hash and pushed to /api/job-events subscribers rather than saved into job.meta.
+    job = get_current_job()
+    if job: job_events.publish(job.connection, job.id, "started", message)
+def render_progress_callback():
+    job = get_current_job(); return job_events.render_progress_reporter(job.connection, job.id) if job else None
+class RenderProgressLogger(proglog.ProgressBarLogger):
+    # MoviePy reports written frames on its "t" bar.
+    def __init__(self, on_progress): super().__init__(); self.on_progress = on_progress
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar == "t" and attr == "index": self.on_progress(value, self.bars[bar].get("total") or 0)
+def current_job_id():
+    # Tasks also run outside RQ (benchmark.py), where there is no current job.
+    job = get_current_job(); return job.id if job else uuid.uuid4().hex
 def download_file_to_temp(url, temp_dir):
     filename = os.path.join(temp_dir, os.path.basename(url.split("?")[0]))
-    with requests.get(url, stream=True) as r: r.raise_for_status(); open(filename, 'wb').write(r.content)
-    return filename
-def generate_audio_elevenlabs(text, filename, voice_id):
-    url=f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"; headers={"xi-api-key": ELEVENLABS_API_KEY}; data={"text": text}; r=requests.post(url, json=data, headers=headers); r.raise_for_status(); open(filename, "wb").write(r.content)
+    with stage("asset_download"): return link_into(get_asset_cache().fetch_url(url), filename)
+def fetch_background(url, duration, temp_dir):
+    if BACKGROUND_FETCH_MODE == "range":
+        try:
+            with stage("asset_download"): return ffmpeg_render.fetch_segment(url, duration, os.path.join(temp_dir, "background_segment.mp4"))
+        except (subprocess.CalledProcessError, OSError, KeyError, ValueError) as e: print(f"Ranged background fetch failed, downloading the full video: {getattr(e, 'stderr', None) or e}")
+    return download_file_to_temp(url, temp_dir)
+def prewarm_assets(include_backgrounds=True):
+    urls = list(ASSET_URLS.values()) + (list(BACKGROUND_VIDEO_URLS.values()) if include_backgrounds else [])
+    for url in urls:
+        try: get_asset_cache().fetch_url(url)
+        except Exception as e: print(f"Could not prewarm asset {url}: {e}")
+def alignment_to_segments(alignment):
+    # Collapse per-character timings into the Whisper-shaped segments/words structure the subtitle loop consumes.
+    words, current = [], None
+    for char, start, end in zip(alignment["characters"], alignment["character_start_times_seconds"], alignment["character_end_times_seconds"]):
+        if char.isspace():
+            if current: words.append(current); current = None
+            continue
+        if current is None: current = {"word": char, "start": start, "end": end}
+        else: current["word"] += char; current["end"] = end
+    if current: words.append(current)
+    if not words: return []
+    return [{"text": " ".join(w["word"] for w in words), "start": words[0]["start"], "end": words[-1]["end"], "words": words}]
+def synthesize_with_timestamps(text, audio_path, voice_id):
+    segments = []
+    with stage("tts"):
+        if TIMESTAMP_SOURCE == "alignment":
+            try:
+                alignment = generate_audio_with_alignment_elevenlabs(text, audio_path, voice_id)
+                segments = alignment_to_segments(alignment) if alignment else []
+                if not segments: print("No alignment returned with the audio, falling back to Whisper.")
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                print(f"Alignment synthesis failed, falling back to Whisper: {e}"); generate_audio_elevenlabs(text, audio_path, voice_id)
+        else: generate_audio_elevenlabs(text, audio_path, voice_id)
+    return segments or get_word_timestamps(audio_path)
+def title_end_time(segments, title_text):
+    # The post image stays up until the last word of the title has been spoken.
+    title_word_count = len(title_text.split())
+    if not segments or not segments[0]['words'] or title_word_count == 0: return 0
+    return segments[0]['words'][min(title_word_count - 1, len(segments[0]['words']) - 1)]['end']
+def make_subtitle_clip(text, style, width):
+    if SUBTITLE_RENDERER == "textclip": return TextClip(text, **style, size=(width, None), method='caption')
+    return caption_clip(text, style, width)
+# --- Rendering ---
+# Tasks describe the video as layers: {"image": path} or {"text", "style", "box_width"}, plus "start", "end",
+# "position", optional "relative" and optional "width"/"height" to resize to. Either backend renders the same list.
+def layer_clip(layer, clip=None):
+    if clip is None: clip = make_subtitle_clip(layer["text"], layer["style"], layer["box_width"]) if "text" in layer else ImageClip(layer["image"])
+    if layer.get("width") or layer.get("height"): clip = clip.resize(width=layer.get("width"), height=layer.get("height"))
+    return clip.set_start(layer["start"]).set_duration(layer["end"] - layer["start"]).set_position(layer.get("position", "center"), relative=layer.get("relative", False))
+def render_with_ffmpeg(background_path, audio_clip, layers, output_path, temp_dir, audio_path=None, on_progress=None):
+    if audio_path is None: audio_path = os.path.join(temp_dir, "final_audio.wav"); audio_clip.write_audiofile(audio_path, logger=None)
+    overlays, caption_paths = [], {}
+    with stage("subtitle_build"):
+        for layer in layers:
+            if "text" in layer:
+                key = (layer["text"], tuple(sorted(layer["style"].items())), int(layer["box_width"]))
+                if key not in caption_paths:
+                    caption_paths[key] = os.path.join(temp_dir, f"caption_{len(caption_paths)}.png"); PILImage.fromarray(render_caption(layer["text"], layer["style"], layer["box_width"])).save(caption_paths[key])
+                layer = {**layer, "image": caption_paths[key]}
+            overlays.append({**layer, "path": layer["image"]})
+    # ffmpeg composites and encodes in the same pass, so both are timed as "encode" here.
+    with stage("encode", failed_as="encode_failed") as encode: encode["frames"] = int(audio_clip.duration * 24); return ffmpeg_render.render_timeline(background_path, audio_path, audio_clip.duration, overlays, output_path, on_progress=on_progress)
+def render_video(background_path, audio_clip, layers, output_path, temp_dir, audio_path=None, threads=None):
+    layers = [layer for layer in layers if layer["end"] > layer["start"]]; on_progress = render_progress_callback()
+    if RENDER_BACKEND == "ffmpeg":
+        try: return render_with_ffmpeg(background_path, audio_clip, layers, output_path, temp_dir, audio_path, on_progress)
+        except (subprocess.CalledProcessError, OSError) as e: print(f"ffmpeg render failed, falling back to MoviePy: {getattr(e, 'stderr', None) or e}")
+    with stage("subtitle_build"): captions = [make_subtitle_clip(layer["text"], layer["style"], layer["box_width"]) if "text" in layer else None for layer in layers]
+    with stage("composite"):
+        background = VideoFileClip(background_path).subclip(0, audio_clip.duration).set_audio(audio_clip)
+        final_video = CompositeVideoClip([background.set_start(0)] + [layer_clip(layer, caption) for layer, caption in zip(layers, captions)], size=background.size)
+    with stage("encode") as encode: encode["frames"] = int(audio_clip.duration * 24); final_video.write_videofile(output_path, codec="libx264", audio_codec="aac", fps=24, threads=threads or int(ffmpeg_render.FFMPEG_THREADS) or None, logger=RenderProgressLogger(on_progress) if on_progress else 'bar'); return output_path
+def max_rss_mb(): return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# --- Whisper model, loaded once per process ---
+# worker.py calls load_whisper_model() before forking work horses, so every job inherits the weights copy-on-write.
+_whisper_model = None
+def load_whisper_model():
+    global _whisper_model
+    if _whisper_model is None:
+        # Imported here so the web app and the render tests can import tasks without pulling in torch.
+        import whisper
+        started = time.time(); _whisper_model = whisper.load_model(WHISPER_MODEL_SIZE)
+        print(f"Loaded Whisper '{WHISPER_MODEL_SIZE}' in {time.time() - started:.2f}s (max RSS {max_rss_mb():.0f} MB)")
+    return _whisper_model
 def get_word_timestamps(audio_path):
-    update_job_progress("Transcribing for timestamps..."); model = whisper.load_model("tiny.en"); result = model.transcribe(audio_path, word_timestamps=True); return result.get("segments", [])
+    update_job_progress("Transcribing for timestamps..."); model = load_whisper_model(); started = time.time()
+    with stage("transcription"): result = model.transcribe(audio_path, word_timestamps=True)
+    print(f"Transcribed {os.path.basename(audio_path)} in {time.time() - started:.2f}s (max RSS {max_rss_mb():.0f} MB)"); return result.get("segments", [])
 
-def create_reddit_post_image(data: dict, temp_dir: str):
-    template_path = download_file_to_temp(ASSET_URLS["reddit_template"], temp_dir)
-    font_user_path = download_file_to_temp(ASSET_URLS["font_semibold"], temp_dir)
-    font_title_path = download_file_to_temp(ASSET_URLS["font_bold"], temp_dir)
-    font_stats_path = download_file_to_temp(ASSET_URLS["font_semibold"], temp_dir)
-    pfp_path = download_file_to_temp(ASSET_URLS["default_pfp"], temp_dir)
-    if data.get("pfp_url") and "http" in data["pfp_url"]:
-        try: pfp_path = download_file_to_temp(data["pfp_url"], temp_dir)
-        except Exception as e: print(f"Could not download user PFP: {e}")
-    template = PILImage.open(template_path).convert("RGBA"); pfp = PILImage.open(pfp_path).convert("RGBA").resize((68, 68)); mask = PILImage.new('L', pfp.size, 0); draw_mask = ImageDraw.Draw(mask); draw_mask.ellipse((0, 0) + pfp.size, fill=255); template.paste(pfp, (45, 42), mask)
-    draw = ImageDraw.Draw(template); font_user = ImageFont.truetype(font_user_path, 26); font_title = ImageFont.truetype(font_title_path, 44); font_stats = ImageFont.truetype(font_stats_path, 28)
+# --- Reddit post image ---
+# Assets are decoded once into memory so the web app's preview renderer (preview.py) can keep them for its lifetime.
+def _read_asset(key): return open(get_asset_cache().fetch_url(ASSET_URLS[key]), "rb").read()
+def load_pfp(source): return PILImage.open(source).convert("RGBA").resize((68, 68))
+def load_reddit_post_assets():
+    semibold, bold = _read_asset("font_semibold"), _read_asset("font_bold")
+    mask = PILImage.new('L', (68, 68), 0); ImageDraw.Draw(mask).ellipse((0, 0, 68, 68), fill=255)
+    return {"template": PILImage.open(io.BytesIO(_read_asset("reddit_template"))).convert("RGBA"), "pfp": load_pfp(io.BytesIO(_read_asset("default_pfp"))), "pfp_mask": mask,
+            "checkmark": PILImage.open(io.BytesIO(_read_asset("verified_checkmark"))).convert("RGBA").resize((32, 32)),
+            "font_user": ImageFont.truetype(io.BytesIO(semibold), 26), "font_title": ImageFont.truetype(io.BytesIO(bold), 44), "font_stats": ImageFont.truetype(io.BytesIO(semibold), 28)}
+def draw_reddit_post(data: dict, assets: dict, pfp=None):
+    template = assets["template"].copy(); template.paste(pfp or assets["pfp"], (45, 42), assets["pfp_mask"])
+    draw = ImageDraw.Draw(template); font_user, font_title, font_stats = assets["font_user"], assets["font_title"], assets["font_stats"]
     draw.text((125, 48), data.get('username', 'u/Anonymous'), font=font_user, fill="#c7c9ca"); draw.text((125, 78), data.get('subreddit', 'r/stories'), font=font_user, fill="#7f8284")
     if data.get("is_verified"):
-        checkmark_path = download_file_to_temp(ASSET_URLS["verified_checkmark"], temp_dir)
-        checkmark = PILImage.open(checkmark_path).convert("RGBA").resize((32, 32)); username_bbox = draw.textbbox((125, 48), data.get('username', 'u/Anonymous'), font=font_user); template.paste(checkmark, (username_bbox[2] + 8, 46), checkmark)
+        checkmark = assets["checkmark"]; username_bbox = draw.textbbox((125, 48), data.get('username', 'u/Anonymous'), font=font_user); template.paste(checkmark, (username_bbox[2] + 8, 46), checkmark)
     y_pos = 145
     for line in textwrap.wrap(data.get('title', 'Your Awesome Title Goes Here'), width=40): draw.text((60, y_pos), line, font=font_title, fill="#000000"); y_pos += 55
     draw.text((160, 485), data.get('upvotes', '99') + "k", font=font_stats, fill="#c7c9ca", anchor="ls"); draw.text((320, 485), data.get('comments', '99') + "+", font=font_stats, fill="#c7c9ca", anchor="ls")
-    output_filename = os.path.join(temp_dir, f"reddit_post_{int(time.time())}.png"); template.save(output_filename, "PNG"); return output_filename
+    return template
+def create_reddit_post_image(data: dict, temp_dir: str):
+    pfp = None
+    if data.get("pfp_url") and "http" in data["pfp_url"]:
+        try: pfp = load_pfp(get_asset_cache().fetch_url(data["pfp_url"]))
+        except Exception as e: print(f"Could not download user PFP: {e}")
+    output_filename = os.path.join(temp_dir, f"reddit_post_{int(time.time())}.png"); draw_reddit_post(data, load_reddit_post_assets(), pfp).save(output_filename, "PNG"); return output_filename
 
-def create_reddit_preview_image(data: dict):
-    temp_dir = tempfile.mkdtemp()
-    try: return create_reddit_post_image(data, temp_dir)
-    except Exception as e:
-        print(f"Error in preview generation: {e}"); return download_file_to_temp(ASSET_URLS["error_preview"], temp_dir)
-    finally: shutil.rmtree(temp_dir)
+def upload_video(path):
+    with stage("upload"): return cloudinary.uploader.upload(path, resource_type="video")
 
 # --- MAIN TASK FUNCTIONS ---
 def create_reddit_video_task(reddit_data: dict, options: dict):
-    job_id, temp_dir = get_current_job().id, tempfile.mkdtemp()
+    job_id, temp_dir = current_job_id(), tempfile.mkdtemp()
     try:
         update_job_progress("Generating assets..."); narrator_voice = options.get("narrator_voice", "reddit_default"); title_text, body_text = reddit_data.get('title', ''), reddit_data.get('body', ''); full_text = f"{title_text}. {body_text}" if body_text.strip() else title_text
-        audio_path = os.path.join(temp_dir, f"full_audio_{job_id}.mp3"); generate_audio_elevenlabs(full_text, audio_path, VOICE_IDS[narrator_voice])
-        segments = get_word_timestamps(audio_path)
-        title_word_count = len(title_text.split()); title_duration = 0
-        if segments and segments[0]['words'] and title_word_count > 0: title_duration = segments[0]['words'][min(title_word_count - 1, len(segments[0]['words']) - 1)]['end']
-        audio_clip = AudioFileClip(audio_path); bg_url = BACKGROUND_VIDEO_URLS.get(options.get("backgroundVideo", "minecraft_parkour1")); bg_path = download_file_to_temp(bg_url, temp_dir)
-        background_video = VideoFileClip(bg_path).subclip(0, audio_clip.duration).set_audio(audio_clip); update_job_progress("Generating dynamic subtitles...")
-        post_image_path = create_reddit_post_image(reddit_data, temp_dir); post_clip = ImageClip(post_image_path).set_duration(title_duration).resize(width=1000).set_position('center')
+        audio_path = os.path.join(temp_dir, f"full_audio_{job_id}.mp3"); segments = synthesize_with_timestamps(full_text, audio_path, VOICE_IDS[narrator_voice])
+        title_duration = title_end_time(segments, title_text)
+        audio_clip = AudioFileClip(audio_path); bg_url = BACKGROUND_VIDEO_URLS.get(options.get("backgroundVideo", "minecraft_parkour1")); bg_path = fetch_background(bg_url, audio_clip.duration, temp_dir)
+        bg_width = ffmpeg_parse_infos(bg_path)['video_size'][0]; update_job_progress("Generating dynamic subtitles...")
+        post_image_path = create_reddit_post_image(reddit_data, temp_dir); layers = [{"image": post_image_path, "start": 0, "end": title_duration, "width": 1000, "position": 'center'}]
         
-        subtitle_clips = []
         word_group_size = options.get("word_group_size", 3); size_multiplier = options.get("subtitle_size_multiplier", 1.0)
         # --- THE FIX: Create a safe copy of the style dictionary for this job ---
         style = SUBTITLE_STYLES.get("standard", {}).copy()
         style['fontsize'] = int(style.get('fontsize', 40) * size_multiplier)
         
+        # Word timings are already absolute, and body words only start after the title has been read out.
         all_words = [word for seg in segments for word in seg['words']]; body_words = all_words[title_word_count:]
         for i in range(0, len(body_words), word_group_size):
             chunk = body_words[i:i+word_group_size]; text = " ".join([word_info['word'] for word_info in chunk])
-            start_time = chunk[0]['start'] - title_duration; end_time = chunk[-1]['end'] - title_duration
-            txt_clip = TextClip(text, **style, size=(background_video.w * 0.85, None), method='caption').set_position(('center', 'center')).set_start(start_time).set_duration(end_time - start_time)
-            subtitle_clips.append(txt_clip)
+            layers.append({"text": text, "style": style, "box_width": bg_width * 0.85, "start": chunk[0]['start'], "end": chunk[-1]['end'], "position": ('center', 'center')})
 
-        update_job_progress("Compositing final video..."); body_start_time = title_duration if title_duration > 0 else 0
-        final_video = CompositeVideoClip([background_video.set_start(0), post_clip.set_start(0)] + [sc.set_start(body_start_time) for sc in subtitle_clips])
         output_path = os.path.join(temp_dir, f"final_reddit_{job_id}.mp4")
-        update_job_progress("Rendering video..."); final_video.write_videofile(output_path, codec="libx264", audio_codec="aac", fps=24, threads=2)
-        update_job_progress("Uploading..."); upload_result = cloudinary.uploader.upload(output_path, resource_type="video")
+        update_job_progress("Rendering video..."); render_video(bg_path, audio_clip, layers, output_path, temp_dir, audio_path=audio_path, threads=2)
+        update_job_progress("Uploading..."); upload_result = upload_video(output_path)
         return {"video_url": upload_result['secure_url']}
     finally: shutil.rmtree(temp_dir)
 
 def create_video_task(dialogue_data: list, options: dict):
-    job_id, temp_dir = get_current_job().id, tempfile.mkdtemp()
-    audio_clips, video_clips = [], []
+    job_id, temp_dir = current_job_id(), tempfile.mkdtemp()
     try:
         update_job_progress("Downloading assets..."); char_paths = {"peter": download_file_to_temp(ASSET_URLS["peter_char"], temp_dir), "brian": download_file_to_temp(ASSET_URLS["brian_char"], temp_dir)}
         # --- THE FIX: Create a safe copy of the style dictionary for this job ---
@@ -127,26 +240,25 @@ def create_video_task(dialogue_data: list, options: dict):
         bg_url = BACKGROUND_VIDEO_URLS.get(options.get("backgroundVideo", "minecraft_parkour1"))
         
         update_job_progress("Generating audio...")
-        for i, line in enumerate(dialogue_data):
-            filename = os.path.join(temp_dir, f"audio_{job_id}_{i}.mp3")
-            generate_audio_elevenlabs(line['text'], filename, VOICE_IDS[line['character']]); audio_clips.append(AudioFileClip(filename))
+        filenames = [os.path.join(temp_dir, f"audio_{job_id}_{i}.mp3") for i in range(len(dialogue_data))]
+        with stage("tts"): generate_audio_many([(line['text'], VOICE_IDS[line['character']]) for line in dialogue_data], filenames)
+        audio_clips = [AudioFileClip(filename) for filename in filenames]
         final_audio = concatenate_audioclips(audio_clips).audio_normalize()
         
-        bg_path = download_file_to_temp(bg_url, temp_dir); background_clip = VideoFileClip(bg_path).subclip(0, final_audio.duration).set_audio(final_audio)
+        bg_path = fetch_background(bg_url, final_audio.duration, temp_dir); bg_width = ffmpeg_parse_infos(bg_path)['video_size'][0]
         
         update_job_progress("Compositing video...")
-        composited_clips = [background_clip]; current_time = 0
+        layers = []; current_time = 0
         for i, line_data in enumerate(dialogue_data):
-            img_clip = ImageClip(char_paths[line_data["character"]]).set_duration(audio_clips[i].duration).set_start(current_time).resize(height=600).set_position(line_data.get("imagePlacement", "center"))
-            txt_clip = TextClip(line_data["text"], **style, size=(background_clip.w * 0.8, None), method='caption').set_duration(audio_clips[i].duration).set_start(current_time).set_position(("center", 0.8), relative=True)
-            video_clips.extend([img_clip, txt_clip]); composited_clips.extend([img_clip, txt_clip])
-            current_time += audio_clips[i].duration
+            end_time = current_time + audio_clips[i].duration
+            layers.append({"image": char_paths[line_data["character"]], "start": current_time, "end": end_time, "height": 600, "position": line_data.get("imagePlacement", "center")})
+            layers.append({"text": line_data["text"], "style": style, "box_width": bg_width * 0.8, "start": current_time, "end": end_time, "position": ("center", 0.8), "relative": True})
+            current_time = end_time
         
-        final_video = CompositeVideoClip(composited_clips, size=background_clip.size)
         output_path = os.path.join(temp_dir, f"final_char_{job_id}.mp4")
         
-        update_job_progress("Rendering video..."); final_video.write_videofile(output_path, codec="libx264", audio_codec="aac", fps=24)
-        update_job_progress("Uploading..."); upload_result = cloudinary.uploader.upload(output_path, resource_type="video")
+        update_job_progress("Rendering video..."); render_video(bg_path, final_audio, layers, output_path, temp_dir)
+        update_job_progress("Uploading..."); upload_result = upload_video(output_path)
         
         return {"video_url": upload_result['secure_url']}
     finally: shutil.rmtree(temp_dir)
@@ -0,0 +1,18 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+@pytest.fixture
+def serve():
+    # serve(handler_class) starts a local HTTP server and returns its base URL; servers stop with the test.
+    servers = []
+    def start(handler):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler); servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start(); return f"http://127.0.0.1:{server.server_port}"
+    yield start
+    for server in servers: server.shutdown(); server.server_close()
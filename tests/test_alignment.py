@@ -0,0 +1,45 @@
+import os
+import json
+import base64
+import pytest
+
+pytest.importorskip("moviepy")
+import imageio_ffmpeg
+import tasks
+import tts
+from benchmark import StubHandler
+from conftest import FIXTURES_DIR
+
+TEXT = "My roommate ate it. Now what?"
+with open(os.path.join(FIXTURES_DIR, "with_timestamps_alignment.json")) as f: RECORDED = json.load(f)
+
+class RecordedTTSHandler(StubHandler):
+    # Replays a recorded /with-timestamps alignment; `alignment` = None drops it from the response.
+    ffmpeg, alignment = imageio_ffmpeg.get_ffmpeg_exe(), RECORDED["alignment"]
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"])); body = {"audio_base64": base64.b64encode(self._tone_mp3(2.5)).decode()}
+        if self.alignment: body["alignment"] = self.alignment
+        self._send(json.dumps(body).encode(), "application/json")
+
+@pytest.fixture
+def tts_server(serve, monkeypatch):
+    monkeypatch.setattr(tts, "ELEVENLABS_API_BASE", serve(RecordedTTSHandler)); monkeypatch.setattr(tts, "TTS_CACHE_ENABLED", False)
+    monkeypatch.setattr(tasks, "TIMESTAMP_SOURCE", "alignment")
+
+def test_recorded_alignment_becomes_word_timestamps(tts_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(tasks, "get_word_timestamps", lambda path: pytest.fail("Whisper should not run when alignment is returned"))
+    audio_path = str(tmp_path / "audio.mp3"); segments = tasks.synthesize_with_timestamps(TEXT, audio_path, "voice")
+    assert os.path.getsize(audio_path) > 0 and len(segments) == 1
+    words = segments[0]["words"]
+    assert [w["word"] for w in words] == ["My", "roommate", "ate", "it.", "Now", "what?"]
+    assert [(w["start"], w["end"]) for w in words] == [(0.093, 0.214), (0.249, 0.782), (0.817, 0.991), (1.026, 1.48), (1.515, 1.791), (1.826, 2.218)]
+    assert (segments[0]["start"], segments[0]["end"]) == (0.093, 2.218)
+    assert tasks.title_end_time(segments, "My roommate ate it.") == 1.48
+
+def test_missing_alignment_falls_back_to_whisper(tts_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(RecordedTTSHandler, "alignment", None)
+    whisper_segments = [{"text": TEXT, "start": 0.0, "end": 2.0, "words": [{"word": "My", "start": 0.0, "end": 0.3}]}]; calls = []
+    monkeypatch.setattr(tasks, "get_word_timestamps", lambda path: calls.append(path) or whisper_segments)
+    audio_path = str(tmp_path / "audio.mp3")
+    assert tasks.synthesize_with_timestamps(TEXT, audio_path, "voice") == whisper_segments
+    assert calls == [audio_path] and os.path.getsize(audio_path) > 0
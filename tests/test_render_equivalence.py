@@ -0,0 +1,34 @@
+import subprocess
+import numpy as np
+import pytest
+
+pytest.importorskip("moviepy")
+from PIL import Image as PILImage
+from moviepy.editor import AudioFileClip, VideoFileClip
+import ffmpeg_render
+import tasks
+
+STYLE = {"fontsize": 40, "font": "Arial-Bold", "color": "white", "stroke_color": "black", "stroke_width": 2.5}
+
+@pytest.fixture
+def synthetic_inputs(tmp_path):
+    background, audio, image = str(tmp_path / "bg.mp4"), str(tmp_path / "audio.wav"), str(tmp_path / "overlay.png")
+    subprocess.run([ffmpeg_render.FFMPEG_BINARY, "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=24", "-t", "4", "-pix_fmt", "yuv420p", background], check=True)
+    subprocess.run([ffmpeg_render.FFMPEG_BINARY, "-y", "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100", "-t", "2.5", audio], check=True)
+    PILImage.new("RGBA", (120, 60), (255, 0, 0, 255)).save(image)
+    layers = [{"image": image, "start": 0, "end": 1.5, "width": 100, "position": "center"},
+              {"text": "hello there world", "style": STYLE, "box_width": 256, "start": 1.0, "end": 2.5, "position": ("center", 0.7), "relative": True}]
+    return background, audio, layers
+
+def test_ffmpeg_backend_matches_moviepy(synthetic_inputs, tmp_path, monkeypatch):
+    background, audio, layers = synthetic_inputs; audio_clip = AudioFileClip(audio)
+    ffmpeg_out = tasks.render_with_ffmpeg(background, audio_clip, layers, str(tmp_path / "ffmpeg.mp4"), str(tmp_path), audio_path=audio)
+    monkeypatch.setattr(tasks, "RENDER_BACKEND", "moviepy")
+    moviepy_out = tasks.render_video(background, audio_clip, layers, str(tmp_path / "moviepy.mp4"), str(tmp_path), audio_path=audio)
+    ffmpeg_clip, moviepy_clip = VideoFileClip(ffmpeg_out), VideoFileClip(moviepy_out)
+    assert ffmpeg_clip.size == moviepy_clip.size
+    assert abs(ffmpeg_clip.duration - moviepy_clip.duration) < 0.1
+    # Sample while only the image is shown, while both overlap, and while only the caption is shown.
+    for t in (0.5, 1.2, 2.0):
+        diff = np.abs(ffmpeg_clip.get_frame(t).astype(float) - moviepy_clip.get_frame(t).astype(float)).mean()
+        assert diff < 4, f"frames differ by {diff:.2f} at t={t}"
@@ -0,0 +1,41 @@
+import json
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler
+import asset_cache
+import tts
+
+class MockTTSHandler(BaseHTTPRequestHandler):
+    # Echoes the text back as the "audio" and answers the first request for each text with 429 + Retry-After.
+    requests, lock = [], threading.Lock()
+    def log_message(self, *args): pass
+    def do_POST(self):
+        text = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["text"]
+        with self.lock: self.requests.append((self.path, self.headers.get("xi-api-key"), text)); first = sum(1 for r in self.requests if r[2] == text) == 1
+        body, status, headers = (b"", 429, [("Retry-After", "0")]) if first else (text.encode(), 200, [])
+        self.send_response(status); self.send_header("Content-Length", str(len(body)))
+        for name, value in headers: self.send_header(name, value)
+        self.end_headers(); self.wfile.write(body)
+
+@pytest.fixture
+def mock_tts(serve, tmp_path, monkeypatch):
+    MockTTSHandler.requests = []; cache = asset_cache.AssetCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(tts, "ELEVENLABS_API_BASE", serve(MockTTSHandler)); monkeypatch.setattr(tts, "ELEVENLABS_API_KEY", "test-key")
+    monkeypatch.setattr(tts, "TTS_CACHE_ENABLED", True); monkeypatch.setattr(tts, "get_asset_cache", lambda: cache)
+    monkeypatch.setitem(asset_cache._sessions, "tts", (None, None))  # pick up the patched API key
+    return MockTTSHandler.requests
+
+def test_generate_audio_many_retries_429_keeps_order_and_caches(mock_tts, tmp_path):
+    items = [(f"line number {i}", ("peter", "brian")[i % 2]) for i in range(6)]; filenames = [str(tmp_path / f"line_{i}.mp3") for i in range(len(items))]
+    tts.generate_audio_many(items, filenames, max_workers=3)
+    # Every file holds the audio for its own item, whatever order the concurrent requests finished in.
+    for (text, _), filename in zip(items, filenames):
+        with open(filename, "rb") as f: assert f.read() == text.encode()
+    # Each line was rate limited once and retried once; the voice id and API key went with every request.
+    assert sorted((path, key, text) for path, key, text in mock_tts) == sorted([(f"/v1/text-to-speech/{voice}", "test-key", text) for text, voice in items] * 2)
+    # A second run is served entirely from the disk cache.
+    again = [str(tmp_path / f"again_{i}.mp3") for i in range(len(items))]; requests_before = len(mock_tts)
+    tts.generate_audio_many(items, again)
+    assert len(mock_tts) == requests_before
+    for (text, _), filename in zip(items, again):
+        with open(filename, "rb") as f: assert f.read() == text.encode()
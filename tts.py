@@ -0,0 +1,49 @@
+import os
+import json
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util.retry import Retry
+from asset_cache import get_asset_cache, link_into, pooled_session
+
+# --- ElevenLabs TTS client ---
+# One pooled session per process, retries with backoff on 429/5xx (honouring Retry-After), bounded
+# concurrent synthesis, and a disk cache keyed on everything that affects the audio.
+ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+ELEVENLABS_API_BASE = os.getenv("ELEVENLABS_API_BASE", "https://api.elevenlabs.io")
+ELEVENLABS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID")  # unset uses the API's default model
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE", "1") == "1"
+
+def get_session():
+    retry = Retry(total=5, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(["POST"]), respect_retry_after_header=True)
+    return pooled_session("tts", retry, pool_maxsize=max(TTS_CONCURRENCY, 10), headers={"xi-api-key": ELEVENLABS_API_KEY or ""})
+
+def _payload(text):
+    data = {"text": text}
+    if ELEVENLABS_MODEL_ID: data["model_id"] = ELEVENLABS_MODEL_ID
+    return data
+
+def cache_key(text, voice_id, with_timestamps=False):
+    spec = {"voice_id": voice_id, "with_timestamps": with_timestamps, **_payload(text)}
+    return "tts:" + hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _synthesize(text, filename, voice_id, with_timestamps):
+    key = cache_key(text, voice_id, with_timestamps); cache = get_asset_cache() if TTS_CACHE_ENABLED else None
+    entry = cache.get_entry(key) if cache else None
+    if entry: link_into(cache.blob_path(entry), filename); return entry.get("alignment")
+    url = f"{ELEVENLABS_API_BASE}/v1/text-to-speech/{voice_id}" + ("/with-timestamps" if with_timestamps else "")
+    r = get_session().post(url, json=_payload(text), timeout=(10, 120)); r.raise_for_status(); alignment = None
+    if with_timestamps: data = r.json(); open(filename, "wb").write(base64.b64decode(data["audio_base64"])); alignment = data.get("alignment") or data.get("normalized_alignment")
+    else: open(filename, "wb").write(r.content)
+    if cache: cache.put_file(key, filename, alignment=alignment)
+    return alignment
+
+def generate_audio_elevenlabs(text, filename, voice_id): _synthesize(text, filename, voice_id, False)
+def generate_audio_with_alignment_elevenlabs(text, filename, voice_id): return _synthesize(text, filename, voice_id, True)
+
+def generate_audio_many(items, filenames, max_workers=None):
+    # items are (text, voice_id) pairs; results come back in input order.
+    if not items: return []
+    with ThreadPoolExecutor(max_workers=min(max_workers or TTS_CONCURRENCY, len(items))) as pool:
+        return list(pool.map(lambda args: generate_audio_elevenlabs(*args), [(text, filename, voice_id) for (text, voice_id), filename in zip(items, filenames)]))
@@ -1,23 +1,107 @@
 import os
+import time
+import signal
+import multiprocessing
 import redis
 from rq import Worker, Queue, Connection
+from tasks import prewarm_assets, load_whisper_model, max_rss_mb
+import ffmpeg_render
+import job_cache
+import scheduler
 
-# Define the queues to listen to. 'default' is the standard queue.
-listen = ['default']
+# Define the queues to listen to, highest priority first (see scheduler.listen_order).
+# WORKER_QUEUES can pin this process pool to a subset, e.g. "reddit-platinum,reddit-pro".
+listen = [name for name in os.getenv('WORKER_QUEUES', '').split(',') if name] or scheduler.listen_order()
 
 # Get the Redis URL from the environment variables provided by Render.
 # Fallback to a local Redis instance for testing if needed.
 redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
 
-# Establish a connection to the Redis server.
-conn = redis.from_url(redis_url)
+# Set PREWARM_BACKGROUNDS=0 to skip the multi-megabyte background videos on small disks.
+prewarm_backgrounds = os.getenv('PREWARM_BACKGROUNDS', '1') == '1'
+# Load Whisper in the parent so the forked work horses share its weights instead of deserializing them per job.
+preload_whisper = os.getenv('PRELOAD_WHISPER', '1') == '1'
 
-if __name__ == '__main__':
-    # Use a Connection context manager to ensure the connection is handled correctly.
-    with Connection(conn):
+# Each render runs an ffmpeg encode plus Python work, so budget a couple of cores and ~1 GB per worker process.
+CORES_PER_WORKER = int(os.getenv('WORKER_CORES', '2'))
+MEMORY_PER_WORKER_MB = int(os.getenv('WORKER_MEMORY_MB', '1024'))
+
+# os.cpu_count() and /proc/meminfo describe the host, not the container, so the affinity mask and the
+# cgroup limits (v2 files first, then v1) are what actually bound this process.
+def _read_cgroup(*paths):
+    for path in paths:
+        try:
+            with open(path) as f: return f.read().split()
+        except OSError: continue
+    return None
+
+def available_cores():
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    quota = _read_cgroup('/sys/fs/cgroup/cpu.max') or (_read_cgroup('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') or []) + (_read_cgroup('/sys/fs/cgroup/cpu/cpu.cfs_period_us') or [])
+    if quota and len(quota) == 2 and quota[0] not in ('max', '-1'): cores = min(cores, int(quota[0]) // int(quota[1]))
+    return max(1, cores)
+
+def available_memory_mb():
+    available = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'): available = int(line.split()[1]) // 1024
+    except OSError: pass
+    limit = _read_cgroup('/sys/fs/cgroup/memory.max') or _read_cgroup('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+    usage = _read_cgroup('/sys/fs/cgroup/memory.current') or _read_cgroup('/sys/fs/cgroup/memory/memory.usage_in_bytes')
+    # v1 reports "no limit" as a huge number, which the min() below ignores naturally.
+    if limit and limit[0] != 'max':
+        headroom = (int(limit[0]) - (int(usage[0]) if usage else 0)) // (1024 * 1024)
+        available = headroom if available is None else min(available, headroom)
+    return available
+
+def worker_process_count():
+    if os.getenv('WORKER_PROCESSES'): return max(1, int(os.getenv('WORKER_PROCESSES')))
+    by_cores = available_cores() // CORES_PER_WORKER; memory = available_memory_mb()
+    by_memory = memory // MEMORY_PER_WORKER_MB if memory is not None else by_cores
+    return max(1, min(by_cores, by_memory))
+
+class RenderWorker(Worker):
+    # RQ skips on_failure when the work horse is killed (OOM, SIGKILL), so report it from the parent.
+    def handle_work_horse_killed(self, job, retpid, ret_val, rusage):
+        super().handle_work_horse_killed(job, retpid, ret_val, rusage)
+        try: job_cache.on_render_failure(job, self.connection, None, f"render process was killed (exit status {ret_val})")
+        except Exception as e: print(f"Could not publish failure for job {job.id}: {e}")
+
+def run_worker():
+    # Each process opens its own Redis connection; sockets must not be shared across fork.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    with Connection(redis.from_url(redis_url)):
         # Create a Worker instance that listens on the specified queues.
-        worker = Worker(map(Queue, listen))
-        
         # Start the worker. It will now wait for and execute jobs from the queue.
-        # This is a blocking call, the script will run here indefinitely.
-        worker.work()
+        RenderWorker(map(Queue, listen)).work()
+
+def supervise(count):
+    ctx = multiprocessing.get_context('fork'); processes = []; stopping = False
+    def stop(signum, frame):
+        nonlocal stopping; stopping = True
+        for p in processes:
+            if p.is_alive(): p.terminate()
+    signal.signal(signal.SIGTERM, stop); signal.signal(signal.SIGINT, stop)
+    for _ in range(count): p = ctx.Process(target=run_worker); p.start(); processes.append(p)
+    # Restart any worker that dies until we're asked to stop.
+    while not stopping:
+        for i, p in enumerate(processes):
+            if not p.is_alive() and not stopping:
+                print(f"Worker {p.pid} exited with {p.exitcode}; restarting."); processes[i] = ctx.Process(target=run_worker); processes[i].start()
+        time.sleep(1)
+    for p in processes: p.join()
+
+if __name__ == '__main__':
+    # Fill the shared asset cache before taking jobs so downloads stay off the render hot path.
+    prewarm_assets(include_backgrounds=prewarm_backgrounds)
+    if preload_whisper: load_whisper_model()
+    count = worker_process_count()
+    # Cap each encode at its share of cores; x264's default of one thread per visible core oversubscribes the pool.
+    if not os.getenv('FFMPEG_THREADS'): ffmpeg_render.FFMPEG_THREADS = str(CORES_PER_WORKER)
+    print(f"Starting {count} worker processes on {listen} with {ffmpeg_render.FFMPEG_THREADS} encoder threads each (max RSS {max_rss_mb():.0f} MB)")
+
+    # Worker processes are forked from this one, so they inherit the preloaded model copy-on-write.
+    # This is a blocking call, the script will run here indefinitely.
+    supervise(count)